@@ -1,34 +1,61 @@
 import json
 import os
-from typing import Dict, Optional, Tuple
+import sqlite3
+from typing import Any, Dict, Optional, Tuple
 import re
 
+try:
+    import orjson
+except ImportError:  # orjson is an optional speedup
+    orjson = None
+
+_URL_RE = re.compile(r'https?://[^\s/$.?#].[^\s]*')
+
+def load_json(path: str) -> Any:
+    """Read a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def dump_json(data: Any, path: str) -> None:
+    """Write a JSON file, using orjson when it is installed."""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
 class ConfigManager:
-    def __init__(self, config_path: str = 'config.json'):
+    def __init__(self, config_path: str = 'config.json',
+                 mapping_path: str = 'collections.db'):
         self.config_path = config_path
+        self.mapping_path = mapping_path
         self.config = self._load_config()
+        self._collections: Optional[Dict[str, str]] = None
+        self._mapping_db: Optional[sqlite3.Connection] = None
 
     def _load_config(self) -> Dict:
         """Load existing config or create default"""
         if os.path.exists(self.config_path):
-            with open(self.config_path, 'r') as f:
-                return json.load(f)
+            return load_json(self.config_path)
         return {
             "deployment": {
                 "type": "",
                 "settings": {
                     "url": "",
                     "api_key": "",
-                    "port": 6333
+                    "port": 6333,
+                    "grpc_port": 6334
                 }
-            },
-            "collections": {}
+            }
         }
 
     def save_config(self) -> None:
         """Save configuration to file"""
-        with open(self.config_path, 'w') as f:
-            json.dump(self.config, f, indent=4)
+        dump_json(self.config, self.config_path)
 
     def setup_deployment(self) -> Tuple[str, str]:
         """Interactive deployment setup"""
@@ -46,12 +73,17 @@ class ConfigManager:
                         if not (1024 <= port <= 65535):
                             raise ValueError("Port must be between 1024 and 65535")
                         url = f"http://localhost:{port}"
+                        grpc_port = input("Enter gRPC port number (default: 6334): ").strip()
+                        grpc_port = 6334 if not grpc_port else int(grpc_port)
+                        if not (1024 <= grpc_port <= 65535):
+                            raise ValueError("Port must be between 1024 and 65535")
                         self.config["deployment"] = {
                             "type": "docker",
                             "settings": {
                                 "url": url,
                                 "api_key": "",
-                                "port": port
+                                "port": port,
+                                "grpc_port": grpc_port
                             }
                         }
                         self.save_config()
@@ -65,7 +97,7 @@ class ConfigManager:
                     if not url:
                         print("URL cannot be empty")
                         continue
-                    if not re.match(r'https?://[^\s/$.?#].[^\s]*$', url):
+                    if not _URL_RE.fullmatch(url):
                         print("Invalid URL format")
                         continue
                     
@@ -79,7 +111,8 @@ class ConfigManager:
                         "settings": {
                             "url": url,
                             "api_key": api_key,
-                            "port": None
+                            "port": None,
+                            "grpc_port": 6334
                         }
                     }
                     self.save_config()
@@ -90,11 +123,68 @@ class ConfigManager:
         settings = self.config["deployment"]["settings"]
         return settings["url"], settings["api_key"]
 
-    def update_collection_mapping(self, folder_path: str, collection_name: str) -> None:
-        """Update the folder to collection mapping"""
-        self.config["collections"][folder_path] = collection_name
-        self.save_config()
+    def get_collection_mapping(self) -> Dict[str, str]:
+        """Get the folder to collection mapping, loading it on first use"""
+        if self._collections is None:
+            rows = self._connect_mapping().execute("SELECT folder, collection FROM map ORDER BY rowid")
+            self._collections = dict(rows)
+        return self._collections
+
+    def _connect_mapping(self) -> sqlite3.Connection:
+        """Open the SQLite mapping store, importing older mappings on first use"""
+        if self._mapping_db is None:
+            # Autocommit; the connection is shared by Streamlit script threads
+            db = sqlite3.connect(self.mapping_path, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS map (folder TEXT PRIMARY KEY, collection TEXT NOT NULL,"
+                       " rotated INTEGER NOT NULL DEFAULT 0)")
+            # Stores created before rotations were tracked lack the column
+            columns = [row[1] for row in db.execute("PRAGMA table_info(map)")]
+            if "rotated" not in columns:
+                db.execute("ALTER TABLE map ADD COLUMN rotated INTEGER NOT NULL DEFAULT 0")
+            if db.execute("SELECT COUNT(*) FROM map").fetchone()[0] == 0:
+                db.executemany("INSERT OR REPLACE INTO map (folder, collection) VALUES (?, ?)",
+                               self._legacy_collection_mapping().items())
+            self._mapping_db = db
+        return self._mapping_db
+
+    def _legacy_collection_mapping(self) -> Dict[str, str]:
+        """Mappings written by older versions to collections.json or config.json"""
+        legacy_path = os.path.splitext(self.mapping_path)[0] + '.json'
+        if os.path.exists(legacy_path):
+            return load_json(legacy_path)
+        # Older versions stored folders under "collections" or at the top level
+        mapping = dict(self.config.get("collections", {}))
+        mapping.update({key: value for key, value in self.config.items()
+                        if key not in ("deployment", "collections")})
+        return mapping
+
+    def get_grpc_port(self) -> int:
+        """Get the gRPC port, defaulting to Qdrant's standard port"""
+        return self.config["deployment"]["settings"].get("grpc_port") or 6334
+
+    def update_collection_mapping(self, folder_path: str, collection_name: str,
+                                  rotated: bool = False) -> None:
+        """Update the folder to collection mapping
+
+        ``rotated`` records that the collection's vectors were rotated before
+        storing, so queries must be rotated the same way.
+        """
+        self._connect_mapping().execute(
+            "INSERT OR REPLACE INTO map (folder, collection, rotated) VALUES (?, ?, ?)",
+            (folder_path, collection_name, int(rotated))
+        )
+        mapping = self.get_collection_mapping()
+        mapping.pop(folder_path, None)  # keep the dict in insertion (rowid) order
+        mapping[folder_path] = collection_name
 
     def get_collection_name(self, folder_path: str) -> Optional[str]:
         """Get collection name for a folder"""
-        return self.config["collections"].get(folder_path)
\ No newline at end of file
+        return self.get_collection_mapping().get(folder_path)
+
+    def is_collection_rotated(self, collection_name: str) -> bool:
+        """Whether a collection's vectors were stored rotated"""
+        row = self._connect_mapping().execute(
+            "SELECT MAX(rotated) FROM map WHERE collection = ?", (collection_name,)
+        ).fetchone()
+        return bool(row[0])
@@ -1,53 +1,142 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (
+    Batch, BinaryQuantization, BinaryQuantizationConfig, CompressionRatio, Distance, HnswConfigDiff, VectorParams, OptimizersConfigDiff,
+    ProductQuantization, ProductQuantizationConfig, QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig,
+    ScalarType, SearchParams, SearchRequest
+)
 from qdrant_client.http.exceptions import UnexpectedResponse
-import json
+import asyncio
+from collections import OrderedDict
+import httpx
+import importlib.util
 import logging
-from typing import List, Dict, Any, Optional
-import uuid
-import os
+from typing import List, Dict, Any, Optional, Tuple
+import time
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Number of points sent per upsert request
+DEFAULT_BATCH_SIZE = 64
+# Number of upsert requests kept in flight by the async uploader
+DEFAULT_CONCURRENCY = 4
+# Points per request for the async uploader, which overlaps larger requests
+DEFAULT_ASYNC_BATCH_SIZE = 256
+# Segment size (in KB of vectors) above which Qdrant builds the HNSW index
+DEFAULT_INDEXING_THRESHOLD = 20000
+# Candidates fetched per requested result before rescoring with full vectors
+DEFAULT_OVERSAMPLING = 4.0
+# Share of vector values kept inside the int8 range; outliers are clipped
+QUANTIZATION_QUANTILE = 0.99
+# Vector compression schemes accepted by create_collection
+QUANTIZATION_MODES = ("scalar", "product", "binary", "none")
+# HNSW graph degree and build-time beam width
+HNSW_M = 16
+HNSW_EF_CONSTRUCT = 200
+# Search-time beam width of the HNSW graph traversal
+DEFAULT_EF_SEARCH = 64
+# Qdrant's default gRPC port
+DEFAULT_GRPC_PORT = 6334
+# Points fetched per scroll request when loading a collection into memory
+SCROLL_PAGE_SIZE = 1024
+# Collections kept in memory for exact search, least recently used dropped first
+EXACT_SEARCH_CACHE_SIZE = 2
+# Seconds between retries of an unreachable gRPC port while using REST
+GRPC_RETRY_INTERVAL = 60
+
 class DatabaseManager:
-    def __init__(self, url: str, api_key: str, config_path: str = 'config.json'):
-        """Initialize the database manager."""
+    def __init__(self, url: str, api_key: str,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 concurrency: int = DEFAULT_CONCURRENCY, prefer_grpc: bool = True,
+                 grpc_port: int = DEFAULT_GRPC_PORT):
+        """Initialize the database manager.
+
+        Vectors travel as protobuf over gRPC when ``grpc_port`` is reachable;
+        otherwise the client falls back to the REST API and retries gRPC
+        every GRPC_RETRY_INTERVAL seconds, e.g. once a starting server is up.
+        """
         try:
-            self.client = QdrantClient(url=url, api_key=api_key)
-            self.config_path = config_path
+            self._client, self.use_grpc = self._connect(url, api_key, prefer_grpc, grpc_port)
+            self.prefer_grpc = prefer_grpc
+            self.grpc_port = grpc_port
+            self._next_grpc_retry = time.monotonic() + GRPC_RETRY_INTERVAL
+            self.url = url
+            self.api_key = api_key
+            self.batch_size = batch_size
+            self.concurrency = concurrency
+            # collection name -> (normalized vectors, payloads) for exact search
+            self._candidates: "OrderedDict[str, Tuple[np.ndarray, List[Dict]]]" = OrderedDict()
             logger.info("Successfully initialized DatabaseManager")
         except Exception as e:
             logger.error(f"Failed to initialize DatabaseManager: {str(e)}")
             raise
 
-    def load_config(self) -> Dict:
-        """Load configuration from JSON file."""
-        try:
-            if os.path.exists(self.config_path):
-                with open(self.config_path, 'r') as file:
-                    return json.load(file)
-            return {}
-        except Exception as e:
-            logger.error(f"Error loading config: {str(e)}")
-            return {}
+    @property
+    def client(self) -> QdrantClient:
+        """The sync client, switched over to gRPC once its port answers."""
+        self._retry_grpc()
+        return self._client
+
+    def _retry_grpc(self) -> None:
+        """Swap the REST client for gRPC if the port answers now; rate limited."""
+        if (not self.use_grpc and self.prefer_grpc
+                and time.monotonic() >= self._next_grpc_retry):
+            self._next_grpc_retry = time.monotonic() + GRPC_RETRY_INTERVAL
+            client = self._connect_grpc(self.url, self.api_key, self.grpc_port)
+            if client is not None:
+                # The REST client isn't closed: another session may be mid-request
+                self._client, self.use_grpc = client, True
+                logger.info(f"gRPC port {self.grpc_port} is now reachable, switched from REST")
 
-    def save_config(self, config: Dict) -> None:
-        """Save configuration to JSON file."""
+    @classmethod
+    def _connect(cls, url: str, api_key: str, prefer_grpc: bool,
+                 grpc_port: int) -> Tuple[QdrantClient, bool]:
+        """Open a gRPC client if the port answers, else a REST client.
+
+        Returns the client and whether it talks gRPC.
+        """
+        if prefer_grpc:
+            client = cls._connect_grpc(url, api_key, grpc_port)
+            if client is not None:
+                return client, True
+        return QdrantClient(url=url, api_key=api_key), False
+
+    @staticmethod
+    def _connect_grpc(url: str, api_key: str, grpc_port: int) -> Optional[QdrantClient]:
+        """Open a gRPC client and probe it, or return None if the port doesn't answer."""
         try:
-            with open(self.config_path, 'w') as file:
-                json.dump(config, file, indent=4)
+            client = QdrantClient(url=url, api_key=api_key, prefer_grpc=True,
+                                  grpc_port=grpc_port)
+            client.get_collections()
+            return client
         except Exception as e:
-            logger.error(f"Error saving config: {str(e)}")
-            raise
+            logger.warning(f"gRPC port {grpc_port} unreachable, using REST: {str(e)}")
+            return None
+
+    def create_collection(self, collection_name: str, bulk: bool = False,
+                          quantization: str = "scalar", vector_size: int = 128) -> str:
+        """Create a new collection in the database.
 
-    def create_collection(self, collection_name: str) -> str:
-        """Create a new collection in the database."""
+        ``vector_size`` must match the embedder, e.g. 128 for dlib and 512
+        for ArcFace.
+
+        Vectors are kept as quantized copies in RAM for the first search
+        stage, with the original float32 vectors used for rescoring.
+        ``quantization`` is one of ``QUANTIZATION_MODES``.
+
+        With ``bulk`` set, indexing is disabled so a large initial upload does
+        not compete with HNSW construction; call ``finalize_collection`` once
+        the upload is done.
+        """
         try:
             self.client.create_collection(
                 collection_name=collection_name,
-                vectors_config=VectorParams(size=128, distance=Distance.DOT),
+                vectors_config=VectorParams(size=vector_size, distance=Distance.DOT),
+                hnsw_config=HnswConfigDiff(m=HNSW_M, ef_construct=HNSW_EF_CONSTRUCT),
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=0) if bulk else None,
+                quantization_config=self._quantization_config(quantization),
             )
             return "Success"
         except UnexpectedResponse as e:
@@ -58,57 +147,316 @@ class DatabaseManager:
             logger.error(f"Error creating collection: {str(e)}")
             raise
 
+    @staticmethod
+    def _quantization_config(quantization: str):
+        """Build the Qdrant quantization config for a quantization mode."""
+        if quantization == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8, quantile=QUANTIZATION_QUANTILE, always_ram=True
+                )
+            )
+        if quantization == "binary":
+            # One bit per dimension: candidates are ranked by Hamming distance
+            # and the oversampled shortlist is rescored with float32 vectors
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        if quantization == "product":
+            # 32x compression: a 128-d float32 vector (512 bytes) becomes
+            # 16 one-byte codes scored through per-query lookup tables
+            return ProductQuantization(
+                product=ProductQuantizationConfig(compression=CompressionRatio.X32, always_ram=True)
+            )
+        if quantization == "none":
+            return None
+        raise ValueError(f"Unknown quantization mode: {quantization}")
+
+    def finalize_collection(self, collection_name: str,
+                            indexing_threshold: int = DEFAULT_INDEXING_THRESHOLD) -> None:
+        """Re-enable indexing on a collection created with ``bulk=True``."""
+        try:
+            self.client.update_collection(
+                collection_name=collection_name,
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold),
+            )
+        except Exception as e:
+            logger.error(f"Error finalizing collection: {str(e)}")
+            raise
+
     def store_embeddings(self, collection_name: str, embeddings: List[Any], 
-                        filenames: List[str]) -> Dict[str, Any]:
-        """Store embeddings in the database."""
+                        filenames: List[str], batch_size: Optional[int] = None,
+                        parallel: int = 1) -> Dict[str, Any]:
+        """Store embeddings in the database.
+
+        The embeddings are stacked into a single float32 matrix and handed to
+        ``upload_collection``, which batches the requests and, with
+        ``parallel`` > 1, spreads them across worker processes.
+
+        Only the last batch waits for the server to apply it. Qdrant applies
+        updates in order, so once that upsert returns the whole upload is
+        searchable; if it fails, earlier batches may still have been applied.
+        """
         results = {
             'success_count': 0,
             'error_count': 0,
             'errors': []
         }
+        if not embeddings:
+            return results
+        self._candidates.pop(collection_name, None)
+
+        batch_size = batch_size or self.batch_size
+        vectors = self._stack_embeddings(embeddings)
+        payload = [{"image": filename} for filename in filenames]
+        ids = self._new_point_ids(len(filenames))
+        last = len(ids) - ((len(ids) - 1) % batch_size + 1)
 
         try:
-            for embedding, filename in zip(embeddings, filenames):
+            if last:
+                self.client.upload_collection(
+                    collection_name=collection_name,
+                    vectors=vectors[:last],
+                    payload=payload[:last],
+                    ids=ids[:last],
+                    batch_size=batch_size,
+                    parallel=parallel,
+                    wait=False
+                )
+            self.client.upsert(
+                collection_name=collection_name,
+                wait=True,
+                points=Batch(
+                    ids=list(ids[last:]),
+                    vectors=vectors[last:].tolist(),
+                    payloads=payload[last:]
+                )
+            )
+            results['success_count'] = len(filenames)
+        except Exception as e:
+            results['error_count'] = len(filenames)
+            results['errors'] = [{'file': filename, 'error': str(e)} for filename in filenames]
+            logger.error(f"Error in store_embeddings: {str(e)}")
+
+        return results
+
+    async def store_embeddings_async(self, collection_name: str, embeddings: List[Any],
+                                     filenames: List[str], batch_size: Optional[int] = None,
+                                     concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """Store embeddings with several upsert batches in flight at once.
+
+        Batches are sent without waiting for the server to apply them; the
+        last batch is upserted with ``wait=True`` after the others as a
+        barrier, as in ``store_embeddings``.
+
+        The async client is bound to the running event loop, so it is created
+        here and closed before returning; call this through ``asyncio.run``.
+        """
+        results = {
+            'success_count': 0,
+            'error_count': 0,
+            'errors': []
+        }
+        if not embeddings:
+            return results
+        self._candidates.pop(collection_name, None)
+        batch_size = batch_size or DEFAULT_ASYNC_BATCH_SIZE
+        concurrency = concurrency or self.concurrency
+        semaphore = asyncio.Semaphore(concurrency)
+
+        # One conversion for the whole matrix instead of one per vector
+        vectors = self._stack_embeddings(embeddings).tolist()
+        ids = list(self._new_point_ids(len(filenames)))
+        payloads = [{"image": filename} for filename in filenames]
+        batches = [
+            Batch(
+                ids=ids[start:start + batch_size],
+                vectors=vectors[start:start + batch_size],
+                payloads=payloads[start:start + batch_size]
+            )
+            for start in range(0, len(ids), batch_size)
+        ]
+
+        aclient = self._connect_async(concurrency)
+
+        async def upsert_batch(batch: Batch, wait: bool = False) -> None:
+            async with semaphore:
                 try:
-                    point_id = str(uuid.uuid4())
-                    self.client.upsert(
+                    await aclient.upsert(
                         collection_name=collection_name,
-                        wait=True,
-                        points=[PointStruct(
-                            id=point_id,
-                            vector=embedding.tolist(),
-                            payload={"image": filename}
-                        )]
+                        wait=wait,
+                        points=batch
                     )
-                    results['success_count'] += 1
+                    results['success_count'] += len(batch.ids)
                 except Exception as e:
-                    results['error_count'] += 1
-                    results['errors'].append({
-                        'file': filename,
-                        'error': str(e)
-                    })
-                    logger.error(f"Error storing embedding for {filename}: {str(e)}")
+                    results['error_count'] += len(batch.ids)
+                    results['errors'].extend(
+                        {'file': payload["image"], 'error': str(e)} for payload in batch.payloads
+                    )
+                    logger.error(f"Error storing batch: {str(e)}")
 
+        try:
+            await asyncio.gather(*[upsert_batch(batch) for batch in batches[:-1]])
+            await upsert_batch(batches[-1], wait=True)
             return results
-
         except Exception as e:
-            logger.error(f"Error in store_embeddings: {str(e)}")
+            logger.error(f"Error in store_embeddings_async: {str(e)}")
             raise
+        finally:
+            await aclient.close()
+
+    def _connect_async(self, concurrency: int) -> AsyncQdrantClient:
+        """Open an async client over the same transport as the sync client."""
+        self._retry_grpc()
+        if self.use_grpc:
+            # Vectors go as packed protobuf floats; the gRPC channel
+            # multiplexes the in-flight requests over one connection
+            return AsyncQdrantClient(url=self.url, api_key=self.api_key,
+                                     prefer_grpc=True, grpc_port=self.grpc_port)
+        # Keep one pooled connection per in-flight request; multiplex them
+        # over HTTP/2 when the h2 package is installed
+        return AsyncQdrantClient(
+            url=self.url, api_key=self.api_key,
+            limits=httpx.Limits(max_connections=concurrency),
+            http2=importlib.util.find_spec("h2") is not None
+        )
+
+    @staticmethod
+    def _new_point_ids(count: int) -> range:
+        """Allocate sequential integer point IDs for one upload.
+
+        IDs are the upload's millisecond timestamp shifted left 20 bits plus
+        the point's offset, so uploads of fewer than 2**20 points started in
+        different milliseconds never collide. IDs carry no meaning; look up
+        or deduplicate images through the ``image`` payload field.
+        """
+        base = int(time.time() * 1000) << 20
+        return range(base, base + count)
+
+    @staticmethod
+    def _stack_embeddings(embeddings: List[Any]) -> np.ndarray:
+        """Stack embeddings into a contiguous (N, dim) float32 matrix."""
+        return np.ascontiguousarray(np.stack(embeddings), dtype=np.float32)
+
+    def search_similar_faces(self, collection_name: str, query_vector: np.ndarray, 
+                            limit: int = 5,
+                            oversampling: float = DEFAULT_OVERSAMPLING,
+                            ef_search: int = DEFAULT_EF_SEARCH,
+                            exact: bool = False) -> List[Dict]:
+        """Search for similar faces in the database.
 
-    def search_similar_faces(self, collection_name: str, query_vector: List[float], 
-                            limit: int = 5) -> List[Dict]:
-        """Search for similar faces in the database."""
+        ``ef_search`` trades HNSW search speed for recall. With ``exact``
+        the query is scored against every stored face in memory instead.
+        """
         try:
+            if exact:
+                return self._search_exact(collection_name, query_vector, limit)
             results = self.client.search(
                 collection_name=collection_name,
-                query_vector=query_vector,
-                limit=limit
+                query_vector=np.asarray(query_vector).astype(np.float32, copy=False),
+                limit=limit,
+                search_params=self._search_params(oversampling, ef_search)
             )
             return [result.payload for result in results]
         except Exception as e:
             logger.error(f"Error searching similar faces: {str(e)}")
             raise
 
+    def search_similar_faces_batch(self, collection_name: str, query_vectors: List[np.ndarray],
+                                   limit: int = 5,
+                                   oversampling: float = DEFAULT_OVERSAMPLING,
+                                   ef_search: int = DEFAULT_EF_SEARCH,
+                                   exact: bool = False) -> List[List[Dict]]:
+        """Search for the faces most similar to each query in one request.
+
+        Returns one list of payloads per query vector, in query order.
+        """
+        if not len(query_vectors):
+            return []
+        try:
+            if exact:
+                return self._search_exact_batch(collection_name, query_vectors, limit)
+            search_params = self._search_params(oversampling, ef_search)
+            batch_results = self.client.search_batch(
+                collection_name=collection_name,
+                requests=[
+                    SearchRequest(vector=vector.tolist(), limit=limit, params=search_params,
+                                  with_payload=True)
+                    for vector in self._stack_embeddings(query_vectors)
+                ]
+            )
+            return [[result.payload for result in results] for results in batch_results]
+        except Exception as e:
+            logger.error(f"Error searching similar faces: {str(e)}")
+            raise
+
+    @staticmethod
+    def _search_params(oversampling: float, ef_search: int) -> SearchParams:
+        """HNSW beam width plus rescoring of the oversampled quantized shortlist."""
+        return SearchParams(
+            hnsw_ef=ef_search,
+            quantization=QuantizationSearchParams(rescore=True, oversampling=oversampling)
+        )
+
+    def _search_exact(self, collection_name: str, query_vector: np.ndarray,
+                      limit: int) -> List[Dict]:
+        """Rank every stored face by cosine similarity with one matrix product."""
+        return self._search_exact_batch(collection_name, [query_vector], limit)[0]
+
+    def _search_exact_batch(self, collection_name: str, query_vectors: List[np.ndarray],
+                            limit: int) -> List[List[Dict]]:
+        """Score all queries against every stored face with a single matrix product."""
+        vectors, payloads = self._load_candidates(collection_name)
+        if not payloads:
+            return [[] for _ in query_vectors]
+        queries = self._stack_embeddings(query_vectors)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ vectors.T
+        if limit < len(payloads):
+            top = np.argpartition(-scores, limit, axis=1)[:, :limit]
+        else:
+            top = np.broadcast_to(np.arange(len(payloads)), scores.shape)
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1),
+                                 axis=1)
+        return [[payloads[i] for i in row] for row in top]
+
+    def _load_candidates(self, collection_name: str) -> Tuple[np.ndarray, List[Dict]]:
+        """Fetch a collection's vectors and payloads once and keep them in memory.
+
+        Vectors are L2-normalized at load so a dot product is the cosine
+        similarity. Storing through this manager drops the cached copy, and
+        only the EXACT_SEARCH_CACHE_SIZE most recently searched collections
+        are kept.
+        """
+        if collection_name in self._candidates:
+            self._candidates.move_to_end(collection_name)
+            return self._candidates[collection_name]
+        # Free memory before fetching the next collection, not after
+        while len(self._candidates) >= EXACT_SEARCH_CACHE_SIZE:
+            self._candidates.popitem(last=False)
+
+        vectors, payloads, offset = [], [], None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            vectors.extend(record.vector for record in records)
+            payloads.extend(record.payload for record in records)
+            if offset is None:
+                break
+
+        if vectors:
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        else:
+            # Nothing stored yet; keep the matrix shape valid for the product
+            info = self.client.get_collection(collection_name=collection_name)
+            matrix = np.empty((0, info.config.params.vectors.size), dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self._candidates[collection_name] = (matrix, payloads)
+        return matrix, payloads
+
     def get_collection_info(self, collection_name: str) -> Dict:
         """Get information about a collection."""
         try:
@@ -3,19 +3,159 @@ import dlib
 import numpy as np
 from PIL import Image
 import logging
-from typing import List, Optional
+import multiprocessing
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from tqdm import tqdm
 
+try:
+    from insightface.app import FaceAnalysis
+    from insightface.utils import face_align
+except ImportError:  # insightface is an optional GPU backend
+    FaceAnalysis = None
+
+try:
+    import faiss
+except ImportError:  # faiss is optional; without it rotations are random
+    faiss = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# File extensions treated as images when scanning a folder
+IMG_EXT = frozenset({'.png', '.jpg', '.jpeg'})
+# Longest image edge (in pixels) fed to the face detector
+DEFAULT_MAX_DIMENSION = 1024
+# Width (in pixels) of the thumbnails written for the result grid
+THUMBNAIL_WIDTH = 256
+# Images decoded and embedded together per batch
+DEFAULT_BATCH_SIZE = 32
+# Threads decoding the images of one batch
+DECODE_THREADS = 8
+# Batches queued or in flight per pool worker; caps the embeddings held
+# in memory when the caller consumes batches slower than they are made
+TASKS_PER_WORKER = 2
+# Product quantizer sub-vectors the learned rotation is optimized for
+ROTATION_SUBQUANTIZERS = 16
+# Fewest vectors worth learning a rotation from; smaller samples get a random one
+ROTATION_MIN_SAMPLES = 256
+
+class FolderBatch(NamedTuple):
+    """Embeddings and bookkeeping for one batch of a processed folder."""
+    embeddings: List[np.ndarray]
+    filenames: List[str]
+    errors: List[dict]
+    stats: dict
+
+# Embedder owned by each worker process of the folder pool
+_worker_embedder: Optional["FaceEmbedder"] = None
+
+def _init_worker(predictor_path: str, recognition_model_path: str,
+                 max_dimension: Optional[int], normalize: bool) -> None:
+    """Load the dlib models once per worker process."""
+    global _worker_embedder
+    _worker_embedder = FaceEmbedder(predictor_path, recognition_model_path, max_dimension,
+                                    normalize=normalize)
+
+def list_images(folder_path: str) -> List[Tuple[str, str]]:
+    """Return ``(filename, path)`` for every image file in a folder."""
+    # Check if folder exists
+    if not os.path.exists(folder_path):
+        raise FileNotFoundError(f"Folder not found: {folder_path}")
+
+    with os.scandir(folder_path) as entries:
+        return [(entry.name, entry.path) for entry in entries
+                if entry.is_file(follow_symlinks=False)
+                and os.path.splitext(entry.name)[1].lower() in IMG_EXT]
+
+def decode_image(data: bytes) -> np.ndarray:
+    """Decode encoded image bytes into a BGR array."""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Failed to decode image data")
+    return img
+
+def write_thumbnail(img: np.ndarray, thumbnail_path: str, rgb: bool = True) -> None:
+    """Save a copy of an RGB (or, with ``rgb=False``, BGR) image scaled down to THUMBNAIL_WIDTH."""
+    height, width = img.shape[:2]
+    if width > THUMBNAIL_WIDTH:
+        thumbnail = cv2.resize(img, (THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * height // width),
+                               interpolation=cv2.INTER_AREA)
+        if rgb:
+            cv2.cvtColor(thumbnail, cv2.COLOR_RGB2BGR, dst=thumbnail)
+    else:
+        thumbnail = cv2.cvtColor(img, cv2.COLOR_RGB2BGR) if rgb else img
+    cv2.imwrite(thumbnail_path, thumbnail)
+
+def _thumbnail_path(thumbnail_dir: Optional[str], filename: str) -> Optional[str]:
+    return os.path.join(thumbnail_dir, filename) if thumbnail_dir else None
+
+def _embed_batch(images: List[Tuple[str, str]], thumbnail_dir: Optional[str] = None
+                 ) -> List[Tuple[str, List[np.ndarray], Optional[str]]]:
+    """Embed a batch of images in a worker process."""
+    return _worker_embedder.embed_image_files(images, thumbnail_dir)
+
+def fit_rotation(sample: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Fit an orthogonal rotation to apply to embeddings before quantization.
+
+    Rotating spreads variance evenly across dimensions, which lowers the
+    error of the server-side quantizers. With faiss and enough samples the
+    rotation is learned with OPQ; otherwise a random orthogonal matrix is
+    used. Both preserve dot products, so scores are unchanged.
+    """
+    sample = np.ascontiguousarray(sample, dtype=np.float32)
+    dim = sample.shape[1]
+    if (faiss is not None and len(sample) >= ROTATION_MIN_SAMPLES
+            and dim % ROTATION_SUBQUANTIZERS == 0):
+        opq = faiss.OPQMatrix(dim, ROTATION_SUBQUANTIZERS)
+        opq.train(sample)
+        return faiss.vector_to_array(opq.A).reshape(dim, dim).astype(np.float32)
+    gaussian = np.random.default_rng(seed).standard_normal((dim, dim))
+    q, r = np.linalg.qr(gaussian)
+    # Fix the column signs so the result is uniformly distributed
+    return (q * np.sign(np.diag(r))).astype(np.float32)
+
+def rotate_embeddings(embeddings: List[np.ndarray], rotation: np.ndarray) -> List[np.ndarray]:
+    """Apply a rotation from ``fit_rotation`` to a list of embeddings."""
+    if not embeddings:
+        return []
+    return list(np.stack(embeddings).astype(np.float32, copy=False) @ rotation.T)
+
 class FaceEmbedder:
-    def __init__(self, predictor_path: str, recognition_model_path: str):
-        """Initialize the face embedding generator."""
+    # Length of the descriptors produced by dlib's ResNet model
+    embedding_size = 128
+    # Channel order of the images prepared for the models
+    channel_order = "RGB"
+
+    def __init__(self, predictor_path: str, recognition_model_path: str,
+                 max_dimension: Optional[int] = DEFAULT_MAX_DIMENSION,
+                 cnn_detector_path: Optional[str] = None, normalize: bool = True):
+        """Initialize the face embedding generator.
+
+        Images whose longest edge exceeds ``max_dimension`` are downscaled
+        before detection; pass ``None`` to keep full resolution.
+
+        When ``cnn_detector_path`` points to dlib's MMOD model and dlib was
+        built with CUDA, faces are detected on the GPU instead of with the
+        CPU HOG detector.
+
+        With ``normalize`` the descriptors are scaled to unit length, so the
+        dot product used by the collections is the cosine similarity.
+        """
         try:
+            self.predictor_path = predictor_path
+            self.recognition_model_path = recognition_model_path
+            self.max_dimension = max_dimension
+            self.normalize = normalize
             self.detector = dlib.get_frontal_face_detector()
+            self.cnn_detector = None
+            if cnn_detector_path and dlib.DLIB_USE_CUDA and os.path.exists(cnn_detector_path):
+                self.cnn_detector = dlib.cnn_face_detection_model_v1(cnn_detector_path)
+                logger.info("Using CUDA CNN face detector")
             self.predictor = dlib.shape_predictor(predictor_path)
             self.face_rec_model = dlib.face_recognition_model_v1(recognition_model_path)
             logger.info("Successfully initialized FaceEmbedder")
@@ -26,91 +166,422 @@ class FaceEmbedder:
     def get_face_embeddings(self, image) -> List[np.ndarray]:
         """Generate face embeddings from an image."""
         try:
-            # Handle different image input types
-            if isinstance(image, str):
-                # Load image from file path
-                img = cv2.imread(image)
-                if img is None:
-                    raise ValueError(f"Failed to load image from path: {image}")
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            elif isinstance(image, Image.Image):
-                # Convert PIL Image to numpy array
-                img_rgb = np.array(image)
-            elif isinstance(image, np.ndarray):
-                # Handle numpy array input
-                if len(image.shape) == 3 and image.shape[2] == 3:
-                    img_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if image.shape[2] == 3 else image
-                else:
-                    raise ValueError("Invalid image array shape")
-            else:
-                raise TypeError("Unsupported image type")
+            img_rgb = self._load_rgb(image)
 
             # Detect faces
-            faces = self.detector(img_rgb, 1)
+            faces = self._detect_faces(img_rgb)
             if not faces:
                 logger.warning("No faces detected in the image")
                 return []
 
-            # Generate embeddings
-            face_embeddings = []
-            for face in faces:
-                shape = self.predictor(img_rgb, face)
-                face_embedding = np.array(
-                    self.face_rec_model.compute_face_descriptor(img_rgb, shape, 1)
-                )
-                face_embeddings.append(face_embedding)
+            # Generate embeddings for all faces in one descriptor call
+            descriptors = self.face_rec_model.compute_face_descriptor(
+                img_rgb, self._face_shapes(img_rgb, faces), 1
+            )
 
-            return face_embeddings
+            return list(self._descriptor_matrix(descriptors))
 
         except Exception as e:
             logger.error(f"Error generating face embeddings: {str(e)}")
             raise
 
-    def process_image_folder(self, folder_path: str) -> dict:
-        """Process all images in a folder and return their embeddings."""
-        results = {
+    def get_face_embeddings_batch(self, images: List[np.ndarray]) -> List[List[np.ndarray]]:
+        """Generate face embeddings for several BGR images at once."""
+        return self._embed_rgb_batch([self._load_rgb(image) for image in images])
+
+    def _embed_rgb_batch(self, rgb_images: List[np.ndarray]) -> List[List[np.ndarray]]:
+        """Embed prepared RGB images.
+
+        Faces are detected per image, or in a single CNN call when all images
+        share a shape, and the descriptors of every face in the batch come
+        from one ``compute_face_descriptor`` call.
+        """
+        detections = self._detect_faces_batch(rgb_images)
+
+        embeddings: List[List[np.ndarray]] = [[] for _ in rgb_images]
+        with_faces = [i for i, faces in enumerate(detections) if faces]
+        if not with_faces:
+            return embeddings
+
+        descriptors = self.face_rec_model.compute_face_descriptor(
+            [rgb_images[i] for i in with_faces],
+            [self._face_shapes(rgb_images[i], detections[i]) for i in with_faces],
+            1
+        )
+        # Convert every descriptor in the batch at once; each face's
+        # embedding is a row view of the one float32 matrix
+        counts = [len(image_descriptors) for image_descriptors in descriptors]
+        matrix = self._descriptor_matrix(
+            [descriptor for image_descriptors in descriptors for descriptor in image_descriptors]
+        )
+        for i, rows in zip(with_faces, np.split(matrix, np.cumsum(counts)[:-1])):
+            embeddings[i] = list(rows)
+        return embeddings
+
+    def _descriptor_matrix(self, descriptors) -> np.ndarray:
+        """Convert dlib face descriptors into one ``(n, embedding_size)`` float32 matrix."""
+        matrix = np.array(descriptors, dtype=np.float32).reshape(-1, self.embedding_size)
+        if self.normalize:
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return matrix
+
+    def embed_image_files(self, images: List[Tuple[str, str]],
+                          thumbnail_dir: Optional[str] = None
+                          ) -> List[Tuple[str, List[np.ndarray], Optional[str]]]:
+        """Decode and embed a batch of ``(filename, path)`` images.
+
+        Files are decoded and prepared on a thread pool (OpenCV releases the
+        GIL) and then embedded as one batch. Returns one
+        ``(filename, embeddings, error)`` tuple per image.
+        """
+        with ThreadPoolExecutor(max_workers=min(DECODE_THREADS, len(images) or 1)) as pool:
+            decoded = list(pool.map(self._read_rgb, [path for _, path in images]))
+
+        outcomes = {}
+        loaded = []
+        for (filename, image_path), img in zip(images, decoded):
+            if img is None:
+                outcomes[filename] = (filename, [], f"Failed to load image from path: {image_path}")
+            else:
+                loaded.append((filename, img))
+
+        try:
+            batch_embeddings = self._embed_rgb_batch([img for _, img in loaded])
+        except Exception as e:
+            # Fall back to one image at a time so a bad file only fails itself
+            logger.warning(f"Batch embedding failed, retrying per image: {str(e)}")
+            batch_embeddings = []
+            for filename, img in loaded:
+                try:
+                    batch_embeddings.append(self._embed_rgb_batch([img])[0])
+                except Exception as image_error:
+                    batch_embeddings.append(image_error)
+
+        for (filename, img), embeddings in zip(loaded, batch_embeddings):
+            if isinstance(embeddings, Exception):
+                outcomes[filename] = (filename, [], str(embeddings))
+                continue
+            if embeddings and thumbnail_dir:
+                write_thumbnail(img, _thumbnail_path(thumbnail_dir, filename),
+                                rgb=self.channel_order == "RGB")
+            outcomes[filename] = (filename, embeddings, None)
+
+        return [outcomes[filename] for filename, _ in images]
+
+    def _read_rgb(self, image_path: str) -> Optional[np.ndarray]:
+        """Read an image file into a prepared RGB array, or None if unreadable."""
+        img = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        return None if img is None else self._bgr_to_rgb(img, owned=True)
+
+    def _load_rgb(self, image) -> np.ndarray:
+        """Convert a supported image input to a prepared RGB numpy array."""
+        # Handle different image input types
+        if isinstance(image, str):
+            # Load image from file path
+            img = self._read_rgb(image)
+            if img is None:
+                raise ValueError(f"Failed to load image from path: {image}")
+            return img
+        elif hasattr(image, 'read'):
+            # Decode an uploaded / in-memory file straight from its bytes
+            data = image.getvalue() if hasattr(image, 'getvalue') else image.read()
+            return self._bgr_to_rgb(decode_image(data), owned=True)
+        elif isinstance(image, Image.Image):
+            # Convert PIL Image to numpy array
+            return self._limit_size(np.array(image))
+        elif isinstance(image, np.ndarray):
+            # Handle numpy array input
+            if len(image.shape) == 3 and image.shape[2] == 3:
+                return self._bgr_to_rgb(image, owned=False)
+            raise ValueError("Invalid image array shape")
+        raise TypeError("Unsupported image type")
+
+    def _bgr_to_rgb(self, img: np.ndarray, owned: bool) -> np.ndarray:
+        """Downscale a BGR image and convert it to RGB with as few copies as possible.
+
+        Detection cost grows with pixel count, and the descriptor is computed
+        on a ~150px aligned chip, so large photos are downscaled first; the
+        colour conversion then only touches the smaller buffer and runs in
+        place whenever that buffer is not the caller's.
+        """
+        small = self._limit_size(img)
+        if owned or small is not img:
+            return cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=small)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+
+    def _face_shapes(self, img_rgb: np.ndarray,
+                     faces: dlib.rectangles) -> dlib.full_object_detections:
+        """Predict the landmarks of every detected face."""
+        shapes = dlib.full_object_detections()
+        for face in faces:
+            shapes.append(self.predictor(img_rgb, face))
+        return shapes
+
+    def _detect_faces(self, img_rgb: np.ndarray) -> dlib.rectangles:
+        """Detect faces with the CNN detector if loaded, else with HOG."""
+        if self.cnn_detector is None:
+            return self.detector(img_rgb, 1)
+        return dlib.rectangles([detection.rect for detection in self.cnn_detector(img_rgb, 1)])
+
+    def _detect_faces_batch(self, images: List[np.ndarray]) -> List[dlib.rectangles]:
+        """Detect faces in several images, batching on the GPU when possible."""
+        # dlib's batched CNN call needs every image to have the same size
+        if self.cnn_detector is not None and len({img.shape for img in images}) == 1:
+            return [
+                dlib.rectangles([detection.rect for detection in detections])
+                for detections in self.cnn_detector(images, 1, batch_size=len(images))
+            ]
+        return [self._detect_faces(img) for img in images]
+
+    def _limit_size(self, img: np.ndarray) -> np.ndarray:
+        """Downscale an image so its longest edge is at most max_dimension."""
+        longest = max(img.shape[:2])
+        if not self.max_dimension or longest <= self.max_dimension:
+            return img
+        scale = self.max_dimension / longest
+        return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    def process_image_folder(self, folder_path: str,
+                             images: Optional[List[Tuple[str, str]]] = None,
+                             thumbnail_dir: Optional[str] = None,
+                             batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+        """Process all images in a folder and return their embeddings.
+
+        ``images`` may carry a listing already produced by ``list_images``
+        to avoid scanning the folder again. With ``thumbnail_dir`` set, a
+        thumbnail of every image with a face is written there. Images are
+        decoded and embedded ``batch_size`` at a time.
+        """
+        return self._collect(self.iter_image_folder(
+            folder_path, images, thumbnail_dir, batch_size, max_workers=1
+        ))
+
+    def process_image_folder_parallel(self, folder_path: str,
+                                      images: Optional[List[Tuple[str, str]]] = None,
+                                      thumbnail_dir: Optional[str] = None,
+                                      batch_size: int = DEFAULT_BATCH_SIZE,
+                                      max_workers: Optional[int] = None) -> dict:
+        """Process all images in a folder across a pool of worker processes.
+
+        Each worker loads its own copy of the dlib models and embeds whole
+        batches of ``batch_size`` images, so nothing but file paths and
+        embeddings crosses the process boundary. With a GPU model loaded the
+        folder is processed in this process instead, as worker processes
+        cannot share the CUDA context.
+        """
+        return self._collect(self.iter_image_folder(
+            folder_path, images, thumbnail_dir, batch_size, max_workers
+        ))
+
+    def iter_image_folder(self, folder_path: str,
+                          images: Optional[List[Tuple[str, str]]] = None,
+                          thumbnail_dir: Optional[str] = None,
+                          batch_size: int = DEFAULT_BATCH_SIZE,
+                          max_workers: Optional[int] = None) -> Iterator[FolderBatch]:
+        """Yield the embeddings of a folder one batch at a time.
+
+        Arguments are as for ``process_image_folder_parallel``; with
+        ``max_workers=1`` everything runs in this process. The worker pool
+        keeps embedding while the caller handles a batch, so storing one
+        batch overlaps with computing the next; at most TASKS_PER_WORKER
+        batches per worker are queued or finished ahead of the caller.
+        """
+        try:
+            if images is None:
+                images = list_images(folder_path)
+            if thumbnail_dir:
+                os.makedirs(thumbnail_dir, exist_ok=True)
+            batches = self._batches(images, batch_size)
+            if not batches:
+                return
+
+            if max_workers == 1 or not self._use_process_pool():
+                yield from self._folder_batches(
+                    (self.embed_image_files(batch, thumbnail_dir) for batch in batches),
+                    len(images)
+                )
+                return
+
+            # Every worker loads the models, so don't start more than can be used
+            workers = min(max_workers or os.cpu_count(), len(batches))
+            # Spawn rather than fork: the server process runs threads and holds
+            # a gRPC channel, neither of which survives a fork safely
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.predictor_path, self.recognition_model_path, self.max_dimension,
+                          self.normalize)
+            )
+            try:
+                yield from self._folder_batches(
+                    self._bounded_map(executor, partial(_embed_batch, thumbnail_dir=thumbnail_dir),
+                                      batches, workers * TASKS_PER_WORKER),
+                    len(images)
+                )
+            finally:
+                # If the caller stops early, drop the queued batches instead of
+                # embedding the rest of the folder only to discard it
+                executor.shutdown(cancel_futures=True)
+
+        except Exception as e:
+            logger.error(f"Error processing folder {folder_path}: {str(e)}")
+            raise
+
+    @staticmethod
+    def _bounded_map(executor: ProcessPoolExecutor, fn, batches: List, window: int) -> Iterator:
+        """Like ``executor.map``, but with at most ``window`` tasks submitted at once.
+
+        A new batch is submitted each time a result is taken, so results
+        never pile up faster than the caller consumes them.
+        """
+        pending = deque()
+        remaining = iter(batches)
+        for batch in remaining:
+            pending.append(executor.submit(fn, batch))
+            if len(pending) >= window:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for batch in remaining:
+                pending.append(executor.submit(fn, batch))
+                break
+            yield result
+
+    def _folder_batches(self, batch_outcomes: Iterable[List[Tuple[str, List[np.ndarray], Optional[str]]]],
+                        total: int) -> Iterator[FolderBatch]:
+        """Turn per-image outcomes into FolderBatch results with a progress bar."""
+        with tqdm(total=total, desc="Processing images", unit="image") as progress:
+            for outcomes in batch_outcomes:
+                results = self._empty_folder_results()
+                for outcome in outcomes:
+                    self._record_result(results, *outcome)
+                progress.update(len(outcomes))
+                yield FolderBatch(**results)
+
+    def _collect(self, batches: Iterable[FolderBatch]) -> dict:
+        """Merge streamed batches into a single folder result."""
+        results = self._empty_folder_results()
+        for batch in batches:
+            results['embeddings'].extend(batch.embeddings)
+            results['filenames'].extend(batch.filenames)
+            results['errors'].extend(batch.errors)
+            for key, count in batch.stats.items():
+                results['stats'][key] += count
+        return results
+
+    def _use_process_pool(self) -> bool:
+        """Whether folders may be split across worker processes."""
+        return self.cnn_detector is None
+
+    @staticmethod
+    def _batches(images: List[Tuple[str, str]], batch_size: int) -> List[List[Tuple[str, str]]]:
+        return [images[start:start + batch_size] for start in range(0, len(images), batch_size)]
+
+    @staticmethod
+    def _empty_folder_results() -> dict:
+        return {
             'embeddings': [],
             'filenames': [],
             'errors': [],
             'stats': {'processed': 0, 'failed': 0}
         }
 
+    @staticmethod
+    def _record_result(results: dict, filename: str, embeddings: List[np.ndarray],
+                       error: Optional[str] = None) -> None:
+        """Add the outcome for one image to the folder results."""
+        if embeddings:
+            results['embeddings'].extend(embeddings)
+            results['filenames'].extend([filename] * len(embeddings))
+            results['stats']['processed'] += 1
+            return
+
+        results['errors'].append({
+            'file': filename,
+            'error': error or 'No faces detected'
+        })
+        results['stats']['failed'] += 1
+        if error:
+            logger.error(f"Error processing {filename}: {error}")
+
+class InsightFaceEmbedder(FaceEmbedder):
+    """Face embedder backed by InsightFace's SCRFD detector and ArcFace model.
+
+    Both models run under ONNX Runtime, on the GPU when the CUDA execution
+    provider is available. Embeddings are 512-d and L2-normalized, so
+    collections built with the dlib models must be rebuilt to be searched.
+    """
+    embedding_size = 512
+    # InsightFace models take OpenCV's BGR order, so images are kept as decoded
+    channel_order = "BGR"
+
+    def __init__(self, model_root: str, model_name: str = 'buffalo_l',
+                 max_dimension: Optional[int] = DEFAULT_MAX_DIMENSION,
+                 providers: Tuple[str, ...] = ('CUDAExecutionProvider', 'CPUExecutionProvider')):
+        """Load an InsightFace model pack from ``model_root``/models/``model_name``."""
+        if FaceAnalysis is None:
+            raise ImportError("insightface is required for InsightFaceEmbedder")
         try:
-            # Check if folder exists
-            if not os.path.exists(folder_path):
-                raise FileNotFoundError(f"Folder not found: {folder_path}")
-
-            # Get list of image files
-            image_files = [f for f in os.listdir(folder_path) 
-                         if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-            
-            # Process each image in the folder with progress bar
-            for filename in tqdm(image_files, desc="Processing images", unit="image"):
-                try:
-                    image_path = os.path.join(folder_path, filename)
-                    embeddings = self.get_face_embeddings(image_path)
-                    
-                    if embeddings:
-                        results['embeddings'].extend(embeddings)
-                        results['filenames'].extend([filename] * len(embeddings))
-                        results['stats']['processed'] += 1
-                    else:
-                        results['errors'].append({
-                            'file': filename,
-                            'error': 'No faces detected'
-                        })
-                        results['stats']['failed'] += 1
-                        
-                except Exception as e:
-                    results['errors'].append({
-                        'file': filename,
-                        'error': str(e)
-                    })
-                    results['stats']['failed'] += 1
-                    logger.error(f"Error processing {filename}: {str(e)}")
-
-            return results
+            self.max_dimension = max_dimension
+            # ArcFace embeddings are always L2-normalized
+            self.normalize = True
+            self.app = FaceAnalysis(name=model_name, root=model_root, providers=list(providers),
+                                    allowed_modules=['detection', 'recognition'])
+            self.app.prepare(ctx_id=0, det_size=(640, 640))
+            self.recognizer = self.app.models['recognition']
+            logger.info("Successfully initialized InsightFaceEmbedder")
+        except Exception as e:
+            logger.error(f"Failed to initialize InsightFaceEmbedder: {str(e)}")
+            raise
 
+    def get_face_embeddings(self, image) -> List[np.ndarray]:
+        """Generate face embeddings from an image."""
+        try:
+            embeddings = self.get_face_embeddings_batch([image])[0]
+            if not embeddings:
+                logger.warning("No faces detected in the image")
+            return embeddings
         except Exception as e:
-            logger.error(f"Error processing folder {folder_path}: {str(e)}")
+            logger.error(f"Error generating face embeddings: {str(e)}")
             raise
+
+    def _load_rgb(self, image) -> np.ndarray:
+        """Convert a supported image input to a prepared BGR numpy array."""
+        if isinstance(image, Image.Image):
+            img = self._limit_size(np.array(image))
+            return cv2.cvtColor(img, cv2.COLOR_RGB2BGR, dst=img)
+        return super()._load_rgb(image)
+
+    def _bgr_to_rgb(self, img: np.ndarray, owned: bool) -> np.ndarray:
+        """Downscale a BGR image, keeping it BGR for the InsightFace models."""
+        return self._limit_size(img)
+
+    def _embed_rgb_batch(self, rgb_images: List[np.ndarray]) -> List[List[np.ndarray]]:
+        """Embed images prepared by ``_load_rgb``, which are BGR for this backend.
+
+        Faces are detected per image; the aligned crops of every face in the
+        batch then go through a single ArcFace forward pass.
+        """
+        crops, owners = [], []
+        for i, img_bgr in enumerate(rgb_images):
+            _, keypoints = self.app.det_model.detect(img_bgr, max_num=0)
+            if keypoints is None:
+                continue
+            for face_keypoints in keypoints:
+                crops.append(face_align.norm_crop(img_bgr, landmark=face_keypoints,
+                                                  image_size=self.recognizer.input_size[0]))
+                owners.append(i)
+
+        embeddings: List[List[np.ndarray]] = [[] for _ in rgb_images]
+        if not crops:
+            return embeddings
+
+        features = self.recognizer.get_feat(crops).astype(np.float32)
+        features /= np.linalg.norm(features, axis=1, keepdims=True)
+        for owner, feature in zip(owners, features):
+            embeddings[owner].append(feature)
+        return embeddings
+
+    def _use_process_pool(self) -> bool:
+        return False
@@ -1,22 +1,152 @@
 import streamlit as st
-from face_embeddings import FaceEmbedder
-from database_manager import DatabaseManager
+from face_embeddings import (
+    DEFAULT_BATCH_SIZE, FaceAnalysis, FaceEmbedder, InsightFaceEmbedder, decode_image,
+    fit_rotation, list_images, rotate_embeddings
+)
+from database_manager import QUANTIZATION_MODES, DatabaseManager
 from config_manager import ConfigManager
 from datetime import datetime
 from PIL import Image
 import os
-from typing import Dict, Any
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import numpy as np
+from typing import Dict, Any, List, Optional
 import logging
 
 # Constants
 PREDICTOR_PATH = "DAT/shape_predictor_68_face_landmarks.dat"
 RECOGNITION_MODEL_PATH = "DAT/dlib_face_recognition_resnet_model_v1.dat"
+CNN_DETECTOR_PATH = "DAT/mmod_human_face_detector.dat"
+INSIGHTFACE_ROOT = "DAT/insightface"
+INSIGHTFACE_MODEL = "buffalo_l"
 CONFIG_FILE = 'config.json'
+COLLECTIONS_FILE = 'collections.db'
+THUMBNAILS_DIR = 'thumbs'
+ROTATIONS_DIR = "DAT/rotations"
+# Embeddings buffered before each upload while a folder is processed
+UPLOAD_CHUNK_SIZE = 1024
+
+def embedder_class() -> type:
+    """Pick the face model backend without loading any models.
+
+    The InsightFace backend is used when insightface is installed and its
+    model pack is present under INSIGHTFACE_ROOT; otherwise the dlib models.
+    """
+    if FaceAnalysis is not None and os.path.isdir(
+            os.path.join(INSIGHTFACE_ROOT, "models", INSIGHTFACE_MODEL)):
+        return InsightFaceEmbedder
+    return FaceEmbedder
+
+def _load_embedder() -> FaceEmbedder:
+    """Load the face models of the backend chosen by ``embedder_class``."""
+    if embedder_class() is InsightFaceEmbedder:
+        return InsightFaceEmbedder(INSIGHTFACE_ROOT, INSIGHTFACE_MODEL)
+    return FaceEmbedder(PREDICTOR_PATH, RECOGNITION_MODEL_PATH,
+                        cnn_detector_path=CNN_DETECTOR_PATH)
+
+@st.cache_resource
+def start_model_loading() -> Future:
+    """Start loading the face models on a background thread, once per server.
+
+    The first page renders while the models deserialize; only Process and
+    Search wait for them.
+    """
+    loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+    future = loader.submit(_load_embedder)
+    loader.shutdown(wait=False)
+    return future
+
+def get_embedder() -> FaceEmbedder:
+    """Return the shared face models, waiting for them to finish loading."""
+    try:
+        return start_model_loading().result()
+    except Exception:
+        # Don't cache a failed load; the next rerun starts a fresh one
+        start_model_loading.clear()
+        raise
+
+@st.cache_resource
+def get_config_manager() -> ConfigManager:
+    """Parse the config files once; every rerun shares and updates this instance."""
+    return ConfigManager(CONFIG_FILE, COLLECTIONS_FILE)
+
+@st.cache_resource
+def get_db_manager(url: str, api_key: str, grpc_port: int) -> DatabaseManager:
+    """Create one database client per deployment and reuse its connections."""
+    return DatabaseManager(url, api_key, grpc_port=grpc_port)
+
+@st.cache_resource(max_entries=512)
+def load_image(img_path: str, mtime: float) -> Image.Image:
+    """Open an image once and share it across reruns and sessions.
+
+    ``mtime`` is part of the cache key so edited files are picked up.
+    """
+    return Image.open(img_path).copy()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def embed_uploaded(file_bytes: bytes, _image: np.ndarray) -> List[np.ndarray]:
+    """Embed an uploaded image, keyed on its bytes so reruns skip the models.
+
+    ``_image`` is the already decoded upload and is left out of the cache key.
+    """
+    return get_embedder().get_face_embeddings(_image)
+
+@st.cache_resource(max_entries=32)
+def load_rotation(rotation_path: str, mtime: float) -> np.ndarray:
+    """Load a collection's rotation matrix once; ``mtime`` keys out stale copies."""
+    return np.load(rotation_path)
+
+def get_rotation(collection_name: str) -> Optional[np.ndarray]:
+    """Return the rotation applied to a collection's vectors, if it has one.
+
+    Collections processed before rotations were recorded in the mapping
+    store may still have a matrix on disk; it is used when present.
+    """
+    rotation_path = os.path.join(ROTATIONS_DIR, f"{collection_name}.npy")
+    if not os.path.exists(rotation_path):
+        return None
+    return load_rotation(rotation_path, os.path.getmtime(rotation_path))
+
+def get_collection_mapping(config_manager: ConfigManager) -> Dict[str, str]:
+    """Get the folder to collection mapping, read from disk once per session."""
+    if 'collections' not in st.session_state:
+        st.session_state.collections = dict(config_manager.get_collection_mapping())
+    return st.session_state.collections
+
+def show_matches(results: List[Dict], collection_name: str, search_folder: str) -> None:
+    """Show matched images in rows of up to five, preferring their thumbnails."""
+    if not results:
+        st.info("No similar faces found")
+        return
+    cols = st.columns(min(len(results), 5))  # Max 5 images per row
+    for idx, result in enumerate(results):
+        col_idx = idx % 5
+        if col_idx == 0 and idx > 0:
+            cols = st.columns(min(len(results) - idx, 5))
+        try:
+            img_path = os.path.join(THUMBNAILS_DIR, collection_name, result["image"])
+            if not os.path.exists(img_path):
+                img_path = os.path.join(search_folder, result["image"])
+            if os.path.exists(img_path):
+                match_img = load_image(img_path, os.path.getmtime(img_path))
+                cols[col_idx].image(
+                    match_img, 
+                    caption=f"Match {idx + 1}"
+                )
+            else:
+                cols[col_idx].error(
+                    f"Image not found: {result['image']}"
+                )
+        except Exception as e:
+            cols[col_idx].error(
+                f"Error loading image: {result['image']}"
+            )
 
 def initialize_services():
     """Initialize the required services."""
     try:
-        config_manager = ConfigManager(CONFIG_FILE)
+        config_manager = get_config_manager()
         
         # Check if deployment is configured
         if not config_manager.config["deployment"]["type"]:
@@ -25,6 +155,7 @@ def initialize_services():
             
             if deployment_type == "Docker":
                 port = st.number_input("Enter port number:", min_value=1024, max_value=65535, value=6333)
+                grpc_port = st.number_input("Enter gRPC port number:", min_value=1024, max_value=65535, value=6334)
                 url = f"http://localhost:{port}"
                 api_key = ""
             else:  # Cloud
@@ -44,7 +175,8 @@ def initialize_services():
                 "settings": {
                     "url": url,
                     "api_key": api_key,
-                    "port": port if deployment_type == "Docker" else None
+                    "port": port if deployment_type == "Docker" else None,
+                    "grpc_port": grpc_port if deployment_type == "Docker" else 6334
                 }
             }
             config_manager.save_config()
@@ -52,66 +184,108 @@ def initialize_services():
         # Get deployment settings
         url, api_key = config_manager.get_deployment_settings()
         
-        embedder = FaceEmbedder(PREDICTOR_PATH, RECOGNITION_MODEL_PATH)
-        db_manager = DatabaseManager(url, api_key, CONFIG_FILE)
-        return embedder, db_manager, config_manager
+        db_manager = get_db_manager(url, api_key, config_manager.get_grpc_port())
+        return db_manager, config_manager
     
     except Exception as e:
         st.error(f"Failed to initialize services: {str(e)}")
         st.stop()
 
 def process_folder(folder_path: str, embedder: FaceEmbedder, 
-                  db_manager: DatabaseManager) -> Dict[str, Any]:
-    """Process a folder of images and store in database."""
+                  db_manager: DatabaseManager,
+                  config_manager: ConfigManager,
+                  batch_size: int = DEFAULT_BATCH_SIZE,
+                  quantization: str = "scalar") -> Dict[str, Any]:
+    """Process a folder of images and store in database.
+
+    Embeddings are uploaded as they are produced, so memory stays bounded
+    by UPLOAD_CHUNK_SIZE plus the batches the worker pool runs ahead, and
+    uploading overlaps with embedding.
+    """
     try:
         # Create placeholder for progress
         progress_text = st.empty()
         
         # Count total images
-        total_images = len([f for f in os.listdir(folder_path) 
-                          if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-        progress_text.text(f"Found {total_images} images to process...")
-        
-        # Generate embeddings
-        embedding_results = embedder.process_image_folder(folder_path)
+        images = list_images(folder_path)
+        progress_text.text(f"Found {len(images)} images to process...")
+        progress_bar = st.progress(0.0)
         
         # Create new collection
         collection_name = datetime.now().strftime("%Y%m%d%H%M%S")
-        creation_status = db_manager.create_collection(collection_name)
+        creation_status = db_manager.create_collection(collection_name, bulk=True,
+                                                       quantization=quantization,
+                                                       vector_size=embedder.embedding_size)
         
         if creation_status != "Success":
             return {"status": "error", "message": creation_status}
         
-        # Store embeddings
-        if embedding_results['embeddings']:
+        stats = {'processed': 0, 'failed': 0}
+        storage_results = {'success_count': 0, 'error_count': 0}
+        pending_embeddings, pending_filenames = [], []
+        rotation = None
+
+        def store_pending() -> None:
+            nonlocal rotation
+            vectors = pending_embeddings
+            if quantization != "none":
+                # Fit the rotation on the first chunk and reuse it for the
+                # rest of the folder and for queries against the collection
+                if rotation is None:
+                    rotation = fit_rotation(np.stack(pending_embeddings))
+                    os.makedirs(ROTATIONS_DIR, exist_ok=True)
+                    np.save(os.path.join(ROTATIONS_DIR, f"{collection_name}.npy"), rotation)
+                vectors = rotate_embeddings(pending_embeddings, rotation)
+            results = asyncio.run(db_manager.store_embeddings_async(
+                collection_name, vectors, pending_filenames
+            ))
+            storage_results['success_count'] += results['success_count']
+            storage_results['error_count'] += results['error_count']
+            pending_embeddings.clear()
+            pending_filenames.clear()
+
+        # Generate embeddings and thumbnails, storing them as they arrive
+        for batch in embedder.iter_image_folder(
+            folder_path, images, os.path.join(THUMBNAILS_DIR, collection_name), batch_size
+        ):
+            for key, count in batch.stats.items():
+                stats[key] += count
+            pending_embeddings.extend(batch.embeddings)
+            pending_filenames.extend(batch.filenames)
+            if len(pending_embeddings) >= UPLOAD_CHUNK_SIZE:
+                store_pending()
+
+            done = stats['processed'] + stats['failed']
+            progress_bar.progress(done / len(images))
+            progress_text.text(f"Processed {done} of {len(images)} images...")
+
+        if pending_embeddings:
             progress_text.text("Storing embeddings in database...")
-            storage_results = db_manager.store_embeddings(
-                collection_name,
-                embedding_results['embeddings'],
-                embedding_results['filenames']
-            )
+            store_pending()
+        
+        progress_bar.empty()
+        progress_text.empty()
+        
+        if storage_results['success_count'] or storage_results['error_count']:
+            db_manager.finalize_collection(collection_name)
             
-            # Update config
-            config = db_manager.load_config()
-            config[folder_path] = collection_name
-            db_manager.save_config(config)
+            # Update folder to collection mapping
+            config_manager.update_collection_mapping(folder_path, collection_name,
+                                                     rotated=rotation is not None)
+            st.session_state.collections = dict(config_manager.get_collection_mapping())
             
             # Store the collection name in session state
             st.session_state.current_collection = collection_name
             
-            # Clear progress text
-            progress_text.empty()
-            
             return {
                 "status": "success",
                 "collection_name": collection_name,
-                "processed": embedding_results['stats']['processed'],
-                "failed": embedding_results['stats']['failed'],
+                "processed": stats['processed'],
+                "failed": stats['failed'],
                 "stored": storage_results['success_count'],
                 "store_errors": storage_results['error_count']
             }
         
-        progress_text.empty()
         return {"status": "error", "message": "No embeddings generated"}
         
     except Exception as e:
@@ -120,6 +294,7 @@ def process_folder(folder_path: str, embedder: FaceEmbedder,
 def main():
     st.set_page_config(page_title="Face Similarity Search", layout="wide")
     st.title("Face Similarity Search")
+    start_model_loading()
 
     # Initialize session state for current collection if not exists
     if 'current_collection' not in st.session_state:
@@ -135,6 +310,7 @@ def main():
         
         if deployment_type == "Docker":
             port = st.number_input("Enter port number:", min_value=1024, max_value=65535, value=6333)
+            grpc_port = st.number_input("Enter gRPC port number:", min_value=1024, max_value=65535, value=6334)
             url = f"http://localhost:{port}"
             api_key = ""
         else:  # Cloud
@@ -150,13 +326,14 @@ def main():
                 st.stop()
         
         if st.button("Save Configuration"):
-            config_manager = ConfigManager(CONFIG_FILE)
+            config_manager = get_config_manager()
             config_manager.config["deployment"] = {
                 "type": deployment_type.lower(),
                 "settings": {
                     "url": url,
                     "api_key": api_key,
-                    "port": port if deployment_type == "Docker" else None
+                    "port": port if deployment_type == "Docker" else None,
+                    "grpc_port": grpc_port if deployment_type == "Docker" else 6334
                 }
             }
             config_manager.save_config()
@@ -164,14 +341,7 @@ def main():
             st.rerun()  # Changed from experimental_rerun() to rerun()
     else:
         # Initialize services
-        embedder, db_manager, config_manager = initialize_services()
-
-        # Check if any collections exist
-        config = db_manager.load_config()
-        collections = [value for key, value in config.items() 
-                      if key not in ["deployment", "collections"]]
-        if collections:
-            st.session_state.database_populated = True
+        db_manager, config_manager = initialize_services()
 
         # Create tabs
         tab1, tab2 = st.tabs(["Upload Database", "Search Faces"])
@@ -181,6 +351,16 @@ def main():
             
             # Text input for folder path
             folder_path = st.text_input("Enter folder path:")
+            batch_size = st.number_input("Images per embedding batch:", min_value=1,
+                                         max_value=256, value=DEFAULT_BATCH_SIZE)
+            # 1-bit codes only keep enough information for the 512-d
+            # InsightFace embeddings, not the 128-d dlib descriptors
+            quantization_modes = [mode for mode in QUANTIZATION_MODES
+                                  if mode != "binary" or embedder_class().embedding_size >= 512]
+            quantization = st.selectbox("Vector quantization:", quantization_modes,
+                                        help="Product compresses 32x, scalar (int8) keeps the "
+                                             "most accuracy; binary (512-d InsightFace "
+                                             "embeddings only) is the fastest and smallest")
             
             if folder_path:
                 if st.button("Process Folder"):
@@ -188,7 +368,8 @@ def main():
                         st.error("Folder path does not exist")
                     else:
                         with st.spinner("Processing images..."):
-                            results = process_folder(folder_path, embedder, db_manager)
+                            results = process_folder(folder_path, get_embedder(), db_manager,
+                                                     config_manager, batch_size, quantization)
                             
                             if results["status"] == "success":
                                 st.session_state.database_populated = True
@@ -205,19 +386,18 @@ def main():
                                 st.error(f"Error: {results['message']}")
 
         with tab2:
+            # Get available collections
+            mapping = get_collection_mapping(config_manager)
+            if mapping:
+                st.session_state.database_populated = True
+
             if not st.session_state.database_populated:
                 st.warning("Please upload and process images in the 'Upload Database' tab first.")
                 st.stop()
             
             st.header("Search Similar Faces")
             
-            # Get available collections
-            config = db_manager.load_config()
-            collections = []
-            for key, value in config.items():
-                if key != "deployment" and key != "collections":
-                    collections.append(value)
-            collections = list(set(collections))  # Get unique values
+            collections = list(dict.fromkeys(mapping.values()))  # Get unique values
             
             if not collections:
                 st.warning("No collections available. Please process a folder first.")
@@ -239,61 +419,71 @@ def main():
                 
                 # Number of matches to return
                 num_matches = st.slider("Number of matches to return:", 1, 20, 5)
+                exact_search = st.checkbox("Exact search",
+                                           help="Score every stored face in memory "
+                                                "instead of using the approximate index")
                 
                 uploaded_file = st.file_uploader("Upload a face image", type=["jpg", "jpeg", "png"])
                 
                 if uploaded_file:
-                    image = Image.open(uploaded_file)
-                    st.image(image, caption="Uploaded Image", width=300)
+                    # Decode once; the BGR array is shown as-is and fed to the embedder
+                    image = decode_image(uploaded_file.getvalue())
+                    st.image(image, caption="Uploaded Image", width=300, channels="BGR")
+                    
+                    add_to_collection = st.checkbox("Also add this face to the collection")
                     
                     if st.button("Search"):
                         with st.spinner("Searching for similar faces..."):
-                            embeddings = embedder.get_face_embeddings(image)
+                            # A collection built with the other face model can't be searched
+                            collection_size = db_manager.get_collection_info(
+                                selected_collection
+                            ).config.params.vectors.size
+                            embedding_size = get_embedder().embedding_size
+                            if collection_size != embedding_size:
+                                st.error(f"This collection holds {collection_size}-d embeddings "
+                                         f"but the loaded face model produces {embedding_size}-d "
+                                         "ones. Please process the folder again.")
+                                st.stop()
+                            # Unrotated queries against rotated vectors return wrong matches
+                            rotation = get_rotation(selected_collection)
+                            if rotation is None and config_manager.is_collection_rotated(
+                                    selected_collection):
+                                st.error("This collection's rotation matrix is missing from "
+                                         f"{ROTATIONS_DIR}. Please process the folder again.")
+                                st.stop()
+                            embeddings = embed_uploaded(uploaded_file.getvalue(), image)
+                            if rotation is not None:
+                                embeddings = rotate_embeddings(embeddings, rotation)
                             
                             if not embeddings:
                                 st.warning("No faces detected in the uploaded image")
                             else:
-                                # Store the embedding immediately
-                                storage_result = db_manager.store_embeddings(
+                                # Search for every detected face in one request
+                                face_results = db_manager.search_similar_faces_batch(
                                     selected_collection,
-                                    [embeddings[0]],  # Store only the first face if multiple detected
-                                    [uploaded_file.name]
+                                    embeddings,
+                                    limit=num_matches,
+                                    exact=exact_search
                                 )
                                 
-                                # Search for similar faces
-                                results = db_manager.search_similar_faces(
-                                    selected_collection, 
-                                    embeddings[0].tolist(),
-                                    limit=num_matches
-                                )
+                                # Store after searching so the face doesn't match itself
+                                if add_to_collection:
+                                    db_manager.store_embeddings(
+                                        selected_collection,
+                                        [embeddings[0]],  # Store only the first face if multiple detected
+                                        [uploaded_file.name]
+                                    )
                                 
-                                if results:
-                                    st.subheader(f"Top {num_matches} Similar Faces Found:")
-                                    cols = st.columns(min(len(results), 5))  # Max 5 images per row
-                                    for idx, result in enumerate(results):
-                                        col_idx = idx % 5
-                                        if col_idx == 0 and idx > 0:
-                                            cols = st.columns(min(len(results) - idx, 5))
-                                        try:
-                                            img_path = os.path.join(
-                                                next(k for k, v in config.items() 
-                                                    if v == selected_collection), 
-                                                result["image"]
-                                            )
-                                            if os.path.exists(img_path):
-                                                match_img = Image.open(img_path)
-                                                cols[col_idx].image(
-                                                    match_img, 
-                                                    caption=f"Match {idx + 1}"
-                                                )
-                                            else:
-                                                cols[col_idx].error(
-                                                    f"Image not found: {result['image']}"
-                                                )
-                                        except Exception as e:
-                                            cols[col_idx].error(
-                                                f"Error loading image: {result['image']}"
-                                            )
+                                if any(face_results):
+                                    search_folder = next(k for k, v in mapping.items()
+                                                         if v == selected_collection)
+                                    for face_idx, results in enumerate(face_results):
+                                        if len(face_results) > 1:
+                                            st.subheader(f"Face {face_idx + 1}: "
+                                                         f"Top {num_matches} Similar Faces Found:")
+                                        else:
+                                            st.subheader(f"Top {num_matches} Similar Faces Found:")
+                                        show_matches(results, selected_collection, search_folder)
                                 else:
                                     st.info("No similar faces found")
 
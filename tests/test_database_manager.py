@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("qdrant_client")
+
+from database_manager import DatabaseManager
+
+
+class StubClient:
+    """Serves a fixed set of points through ``scroll`` in one page."""
+
+    def __init__(self, vectors, dim=3):
+        self.records = [SimpleNamespace(vector=list(vector), payload={"image": f"{i}.jpg"})
+                        for i, vector in enumerate(vectors)]
+        self.dim = dim
+
+    def scroll(self, collection_name, limit, offset, with_payload, with_vectors):
+        return self.records, None
+
+    def get_collection(self, collection_name):
+        return SimpleNamespace(config=SimpleNamespace(
+            params=SimpleNamespace(vectors=SimpleNamespace(size=self.dim))
+        ))
+
+
+def make_manager(vectors):
+    manager = DatabaseManager.__new__(DatabaseManager)
+    manager._client = StubClient(vectors)
+    manager.prefer_grpc = False
+    manager.use_grpc = False
+    manager._candidates = OrderedDict()
+    return manager
+
+
+def images(results):
+    return [[payload["image"] for payload in row] for row in results]
+
+
+def test_search_exact_batch_empty_collection():
+    manager = make_manager([])
+    assert manager._search_exact_batch("faces", [np.ones(3)], 5) == [[]]
+
+
+def test_search_exact_batch_limit_below_size():
+    manager = make_manager([[1, 0, 0], [0, 1, 0], [0.9, 0.1, 0], [0, 0, 1]])
+    results = manager._search_exact_batch("faces", [np.array([1.0, 0, 0]),
+                                                    np.array([0, 2.0, 0])], 2)
+    assert images(results) == [["0.jpg", "2.jpg"], ["1.jpg", "2.jpg"]]
+
+
+def test_search_exact_batch_limit_at_or_above_size():
+    manager = make_manager([[0, 1, 0], [1, 0, 0], [0.5, 0.5, 0]])
+    results = manager._search_exact_batch("faces", [np.array([1.0, 0, 0])], 10)
+    assert images(results) == [["1.jpg", "2.jpg", "0.jpg"]]
+
+
+def test_load_candidates_keeps_recent_collections_only():
+    manager = make_manager([[1, 0, 0]])
+    for name in ["a", "b", "a", "c"]:
+        manager._load_candidates(name)
+    assert list(manager._candidates) == ["a", "c"]